@@ -1,80 +1,293 @@
 import os
 import re
-import requests
+import asyncio
+import time
+import httpx
+import orjson
 import traceback
 from typing import Optional, List
+from urllib.parse import parse_qsl, quote_plus, urlencode, urlsplit, urlunsplit
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from functools import lru_cache
-from bs4 import BeautifulSoup
-from apscheduler.schedulers.background import BackgroundScheduler
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as LexborHTMLParser
+    except ImportError:  # selectolax is optional; BeautifulSoup remains the fallback
+        LexborHTMLParser = None
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # LangChain Imports
-from langchain_groq import ChatGroq
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from langchain.tools import tool
 
 load_dotenv()
 
+# Verbose agent traces re-format every streamed LLM chunk to stdout; keep them
+# opt-in for debugging rather than paying that cost on every production turn.
+_VERBOSE = os.getenv("CLAW_VERBOSE", "").lower() in ("1", "true", "yes")
+
+# Resolved once at import: the key never changes mid-process, and the static
+# payload fields are shared so each call builds its dict with a single merge.
+_SCRAPER_KEY = os.getenv("SCRAPER_API_KEY")
+_BASE_SCRAPE_PAYLOAD = {'api_key': _SCRAPER_KEY, 'premium': 'true', 'country_code': 'us'}
+_BASE_SEARCH_PAYLOAD = {'api_key': _SCRAPER_KEY, 'premium': 'true'}
+_GOOGLE_SEARCH = "https://www.google.com/search?q={}"
+
+# Amazon product ids are deterministic in the URL; extracting the ASIN in
+# Python spares the LLM from hunting for it in page text.
+_ASIN_RE = re.compile(r'/dp/([A-Z0-9]{10})')
+
+# Fields worth forwarding from ScraperAPI's structured Amazon payload, in the
+# order the report wants them.
+_AUTOPARSE_FIELDS = (
+    "name", "pricing", "list_price", "average_rating", "total_reviews",
+    "availability_status", "feature_bullets", "small_description",
+)
+
+def _summarize_autoparse(text: str) -> Optional[str]:
+    """Turns a ScraperAPI autoparse JSON body into compact LLM-ready text."""
+    try:
+        data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    parts = [f"{field}: {data[field]}" for field in _AUTOPARSE_FIELDS if data.get(field)]
+    return "\n".join(parts)[:_MAX_CLEAN_CHARS] if parts else None
+
+# Shared async client so concurrent scrapes multiplex over pooled keep-alive
+# connections instead of paying a fresh TCP+TLS handshake per scrape.
+_ACLIENT = httpx.AsyncClient(
+    timeout=30,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+    trust_env=False,
+)
+
+# Short-TTL scrape cache: webhook retries and multi-step agent runs frequently
+# re-request the same URL within minutes, so skip the redundant HTTP + parse.
+# The report cache sits in front of the whole agent run: the same listing
+# requested twice in the same mode produces an identical report.
+_SCRAPE_CACHE = {}
+_SCRAPE_CACHE_TTL = 300
+_SCRAPE_CACHE_MAX = 1024
+_REPORT_CACHE = {}
+_REPORT_CACHE_TTL = 1800
+_REPORT_CACHE_MAX = 4096
+
+def _cache_get(cache: dict, key, ttl: int) -> Optional[str]:
+    hit = cache.get(key)
+    if hit and time.monotonic() - hit[0] < ttl:
+        return hit[1]
+    return None
+
+def _cache_put(cache: dict, key, value: str, max_entries: int) -> None:
+    if len(cache) >= max_entries:
+        cache.pop(next(iter(cache)))
+    cache[key] = (time.monotonic(), value)
+
+# Query params that identify a session/campaign rather than the product; two
+# URLs differing only in these are the same listing for caching purposes.
+_TRACKING_PARAMS = ("ref", "ref_", "tag", "psc", "th", "linkCode", "camp", "creative")
+
+def _is_tracking_param(name: str) -> bool:
+    return name.startswith("utm_") or name in _TRACKING_PARAMS
+
+def _normalize_url(url: str) -> str:
+    """Canonical cache key: lowercase host, sorted non-tracking query, no fragment."""
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if "amazon." in host:
+        asin = _ASIN_RE.search(parts.path)
+        if asin:
+            # Every URL variant of an Amazon product collapses to its ASIN page,
+            # so slug/query permutations share one cache entry.
+            return f"{parts.scheme.lower()}://{host}/dp/{asin.group(1)}"
+    path = parts.path
+    ref = path.find("/ref=")
+    if ref >= 0:
+        path = path[:ref]
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query) if not _is_tracking_param(k)
+    ))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
 # --- BACKGROUND SCHEDULER ---
-scheduler = BackgroundScheduler()
-def run_sniper_monitors():
+# AsyncIO scheduler: jobs run on the app's event loop and can share the pooled
+# httpx client instead of hopping to a thread with its own blocking I/O.
+scheduler = AsyncIOScheduler()
+
+# Listings registered for the 15-minute price sweep. Checks fan out
+# concurrently, bounded so the sweep stays inside ScraperAPI's rate limit.
+TRACKED_URLS: List[str] = []
+_SNIPER_CONCURRENCY = 10
+
+async def run_sniper_monitors():
     print("[SYSTEM] Executing background sniper price monitors...")
+    if not TRACKED_URLS:
+        return
+    sem = asyncio.Semaphore(_SNIPER_CONCURRENCY)
+    async def check(url: str) -> str:
+        async with sem:
+            return await _scrape_listing_impl(url)
+    await asyncio.gather(*(check(u) for u in TRACKED_URLS), return_exceptions=True)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     if not scheduler.running:
         scheduler.add_job(run_sniper_monitors, 'interval', minutes=15)
         scheduler.start()
+    # Warm-up: build the agent graph and prime the ScraperAPI and Groq
+    # connections so the first real scan skips agent construction, the TLS
+    # handshakes, and DNS. The one-word Groq ping costs a handful of tokens.
+    get_agent_executor()
+    try:
+        await _ACLIENT.head('http://api.scraperapi.com', timeout=5)
+    except Exception:
+        pass
+    try:
+        await asyncio.wait_for(_get_llm().ainvoke("ping"), timeout=10)
+    except Exception:
+        pass
     yield
     scheduler.shutdown()
+    await _ACLIENT.aclose()
 
 # --- APP INITIALIZATION ---
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 app.mount("/static", StaticFiles(directory="."), name="static")
 
 @app.get("/")
 def get_ui():
     path = os.path.join(os.path.dirname(__file__), "index.html")
-    return FileResponse(path) if os.path.exists(path) else JSONResponse(status_code=404, content={"error": "index.html not found"})
+    return FileResponse(path) if os.path.exists(path) else ORJSONResponse(status_code=404, content={"error": "index.html not found"})
+
+# Cap how much of a page we download and parse: only the first chunk of HTML
+# matters for extraction, and an unbounded body can OOM a worker.
+_MAX_RESPONSE_BYTES = 512 * 1024
+_MAX_CONTENT_LENGTH = 5_000_000
+
+async def _fetch_scraperapi(payload: dict) -> tuple:
+    """Streams a ScraperAPI response, reading at most _MAX_RESPONSE_BYTES of body."""
+    async with _ACLIENT.stream('GET', 'http://api.scraperapi.com', params=payload) as r:
+        if int(r.headers.get("content-length") or 0) > _MAX_CONTENT_LENGTH:
+            raise ValueError(f"Response too large: {r.headers['content-length']} bytes")
+        chunks, received = [], 0
+        async for chunk in r.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= _MAX_RESPONSE_BYTES:
+                break
+        body = b"".join(chunks)[:_MAX_RESPONSE_BYTES]
+        return r.status_code, body.decode(r.encoding or "utf-8", errors="replace")
 
 # --- UTILITY: HTML CLEANER ---
-def clean_html_for_ai(raw_html: str) -> str:
-    soup = BeautifulSoup(raw_html, "html.parser")
-    for element in soup(["script", "style", "nav", "footer", "header", "aside", "noscript", "svg", "iframe"]):
-        element.decompose()
-    
-    content = ""
-    target_ids = ["productTitle", "corePrice_feature_div", "search", "rso", "centerCol", "productDescription"]
-    for tid in target_ids:
-        found = soup.find(id=tid) or soup.find(class_=tid)
-        if found:
-            content += found.get_text(separator=" | ") + "\n"
-
-    if not content.strip():
-        content = soup.get_text(separator=" | ")
-    
-    return re.sub(r'\s+', ' ', content).strip()[:4000]
+# One combined selector so the tree is walked once for every target section,
+# instead of two full soup.find traversals per id.
+_TARGET_IDS = ["productTitle", "corePrice_feature_div", "search", "rso", "centerCol", "productDescription"]
+_TARGET_SELECTOR = ", ".join(f"#{tid}, .{tid}" for tid in _TARGET_IDS)
+_CLUTTER_TAGS = ["script", "style", "nav", "footer", "header", "aside", "noscript", "svg", "iframe"]
+_MAX_CLEAN_CHARS = 4000
+# Per-tool caps: every char is roughly a prompt token, and the agent may call
+# each tool more than once per run. Search results carry more SERP noise than
+# listing pages, so they get the tighter budget.
+_SCRAPE_CLEAN_CHARS = 3000
+_SEARCH_CLEAN_CHARS = 2000
+
+def clean_html_for_ai(raw_html: str, limit: int = _MAX_CLEAN_CHARS) -> str:
+    if LexborHTMLParser is not None:
+        # Lexbor parses and walks the tree in C; typically 20x+ faster than BS4.
+        tree = LexborHTMLParser(raw_html)
+        tree.strip_tags(_CLUTTER_TAGS)
+        parts = [node.text(separator=" | ") for node in tree.css(_TARGET_SELECTOR)]
+        content = "\n".join(parts)
+        if not content.strip():
+            content = tree.body.text(separator=" | ") if tree.body else ""
+    else:
+        from bs4 import BeautifulSoup, SoupStrainer  # deferred: only needed without selectolax
+        # Strain to the target ids so bs4 never builds the 95%+ of the page the
+        # extractor ignores; class-matched and generic pages re-parse in full below.
+        soup = BeautifulSoup(raw_html, "lxml", parse_only=SoupStrainer(id=_TARGET_IDS))
+        for element in soup(_CLUTTER_TAGS):
+            element.decompose()
+        parts = [found.get_text(separator=" | ") for found in soup.select(_TARGET_SELECTOR)]
+        content = "\n".join(parts)
+        if not content.strip():
+            soup = BeautifulSoup(raw_html, "lxml")
+            for element in soup(_CLUTTER_TAGS):
+                element.decompose()
+            parts = [found.get_text(separator=" | ") for found in soup.select(_TARGET_SELECTOR)]
+            content = "\n".join(parts) or soup.get_text(separator=" | ")
+
+    # str.split/join collapses whitespace in one C pass, faster than the regex
+    # engine walking every character. Truncate on a word boundary so the tail
+    # of the LLM input is never a garbage partial token.
+    content = " ".join(content.split())
+    if len(content) > limit:
+        cut = content.rfind(" ", 0, limit)
+        content = content[:cut if cut > 0 else limit]
+    return content
 
 # --- AI TOOLS ---
 
-@tool
-def scrape_listing(url: str) -> str:
-    """Scrapes product details, descriptions, ratings, and pricing from a specific URL."""
-    scraper_key = os.getenv("SCRAPER_API_KEY")
-    payload = {'api_key': scraper_key, 'url': url, 'premium': 'true', 'country_code': 'us'}
+# In-flight scrape registry (singleflight): concurrent requests for the same
+# listing await one ScraperAPI call instead of issuing N identical ones.
+_PENDING_SCRAPES = {}
+
+async def _scrape_listing_impl(url: str) -> str:
+    cache_key = _normalize_url(url)
+    cached = _cache_get(_SCRAPE_CACHE, cache_key, _SCRAPE_CACHE_TTL)
+    if cached is not None:
+        return cached
+    pending = _PENDING_SCRAPES.get(cache_key)
+    if pending is not None:
+        return await pending
+    task = asyncio.ensure_future(_do_scrape(url, cache_key))
+    _PENDING_SCRAPES[cache_key] = task
     try:
-        r = requests.get('http://api.scraperapi.com', params=payload, timeout=30)
-        return clean_html_for_ai(r.text) if r.status_code == 200 else f"Scrape Error {r.status_code}"
+        return await task
+    finally:
+        _PENDING_SCRAPES.pop(cache_key, None)
+
+async def _do_scrape(url: str, cache_key: str) -> str:
+    payload = {**_BASE_SCRAPE_PAYLOAD, 'url': url}
+    # Amazon listings come back as structured JSON with autoparse, skipping the
+    # HTML parse entirely and shrinking the LLM input to the fields that matter.
+    if "amazon." in urlsplit(url).netloc.lower():
+        payload['autoparse'] = 'true'
+    try:
+        status, text = await _fetch_scraperapi(payload)
+        if status != 200:
+            return f"Scrape Error {status}"
+        result = None
+        if 'autoparse' in payload:
+            result = _summarize_autoparse(text)
+        if result is None:
+            # Parsing a capped-but-large page still costs tens of ms of CPU;
+            # run it off-loop so concurrent scrapes and requests keep moving.
+            result = await asyncio.to_thread(clean_html_for_ai, text, _SCRAPE_CLEAN_CHARS)
+        asin = _ASIN_RE.search(url)
+        if asin:
+            result = f"ASIN: {asin.group(1)}\n{result}"
+        _cache_put(_SCRAPE_CACHE, cache_key, result, _SCRAPE_CACHE_MAX)
+        return result
     except Exception as e:
         return str(e)
 
+@tool
+async def scrape_listing(url: str) -> str:
+    """Scrapes product details, descriptions, ratings, and pricing from a specific URL."""
+    return await _scrape_listing_impl(url)
+
 @tool
 def calculate_flipping_margin(buy_price: float, estimated_sell_price: float) -> str:
     """Calculates platform-agnostic flipping potential using a standard 13% generic marketplace fee."""
@@ -84,24 +297,25 @@ def calculate_flipping_margin(buy_price: float, estimated_sell_price: float) ->
     return f"FLIPPING POTENTIAL: Net Profit ${net_profit:.2f} | ROI: {roi:.2f}% | Estimated Selling Fees: ${marketplace_fee:.2f}"
 
 @tool
-def search_market_alternatives(product_name: str) -> str:
+async def search_market_alternatives(product_name: str) -> str:
     """Searches the web for lower prices, alternative deals, and historical price context."""
-    scraper_key = os.getenv("SCRAPER_API_KEY")
-    query = f"{product_name} buy online price comparison"
-    search_url = f"https://www.google.com/search?q={query.replace(' ', '+')}"
-    payload = {'api_key': scraper_key, 'url': search_url, 'premium': 'true'}
+    search_url = _GOOGLE_SEARCH.format(quote_plus(f"{product_name} buy online price comparison"))
+    payload = {**_BASE_SEARCH_PAYLOAD, 'url': search_url}
     try:
-        r = requests.get('http://api.scraperapi.com', params=payload, timeout=30)
-        return clean_html_for_ai(r.text)
+        status, text = await _fetch_scraperapi(payload)
+        if status != 200:
+            return f"Search Error {status}"
+        return await asyncio.to_thread(clean_html_for_ai, text, _SEARCH_CLEAN_CHARS)
     except Exception as e:
         return f"Search Error: {str(e)}"
 
 # --- AGENT SETUP ---
-llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model="llama-3.3-70b-versatile", temperature=0.1)
 tools = [scrape_listing, calculate_flipping_margin, search_market_alternatives]
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", """You are the 'FlipIntel' Agent. 
+# The system prompt is constant, so it is wrapped in a concrete SystemMessage
+# instead of a template: the prompt pipeline reuses the message object as-is
+# rather than re-formatting >1KB of text on every agent tick.
+_SYSTEM_PROMPT = """You are the 'FlipIntel' Agent. 
     You must output a highly structured, professional Markdown report based on the user's requested MODE.
     
     CRITICAL RULE: ALL links you provide MUST be formatted as valid clickable Markdown links, e.g., [Store Name](https://...). Do NOT just output raw URLs.
@@ -116,33 +330,91 @@ prompt = ChatPromptTemplate.from_messages([
     2. Additionally, use `calculate_flipping_margin` and provide a dedicated "Flipping Potential" section showing Net Profit and ROI.
 
     Use clean Markdown headers (##) for each section.
-    """),
+    """
+
+prompt = ChatPromptTemplate.from_messages([
+    SystemMessage(content=_SYSTEM_PROMPT),
     ("human", "{input}"),
     ("placeholder", "{agent_scratchpad}"),
 ])
 
-agent_executor = AgentExecutor(
-    agent=create_tool_calling_agent(llm, tools, prompt), 
-    tools=tools, 
-    verbose=True,
-    max_iterations=5,
-    handle_parsing_errors=True
-)
+@lru_cache(maxsize=1)
+def _get_llm():
+    """Builds the Groq chat client once; shared by the agent and lifespan warm-up."""
+    from langchain_groq import ChatGroq  # deferred so cold start can serve /health first
+    return ChatGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        model=os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"),
+        temperature=0.1,
+        max_tokens=1024,
+    )
+
+@lru_cache(maxsize=1)
+def get_agent_executor() -> AgentExecutor:
+    """Builds the agent graph once, on first use."""
+    return AgentExecutor(
+        agent=create_tool_calling_agent(_get_llm(), tools, prompt),
+        tools=tools,
+        verbose=_VERBOSE,
+        max_iterations=5,
+        handle_parsing_errors=True
+    )
 
 # --- ENDPOINTS ---
 @app.post("/trigger-claw")
 async def trigger_agent(url: str, mode: str = "buyer"):
     try:
+        cache_key = (_normalize_url(url), mode.lower())
+        cached = _cache_get(_REPORT_CACHE, cache_key, _REPORT_CACHE_TTL)
+        if cached is not None:
+            return {"result": cached}
+        # Warm the scrape cache while the LLM is still planning its first step,
+        # so the agent's scrape_listing call overlaps with prompt processing.
+        asyncio.create_task(_scrape_listing_impl(url))
         query = f"Execute {mode.upper()} AUDIT for: {url}. Ensure all deals have clickable Markdown links."
-        response = agent_executor.invoke({"input": query})
+        response = await get_agent_executor().ainvoke({"input": query})
+        _cache_put(_REPORT_CACHE, cache_key, response["output"], _REPORT_CACHE_MAX)
         return {"result": response["output"]}
     except Exception as e:
         traceback.print_exc()
-        return JSONResponse(status_code=500, content={"error": f"Internal Protocol Error: {str(e)}"})
+        return ORJSONResponse(status_code=500, content={"error": f"Internal Protocol Error: {str(e)}"})
+
+@app.post("/trigger-claw/stream")
+async def trigger_agent_stream(url: str, mode: str = "buyer"):
+    """Server-sent-events variant of /trigger-claw: tokens stream as Groq emits
+    them, so the browser shows output at first-token latency instead of waiting
+    for the full report."""
+    query = f"Execute {mode.upper()} AUDIT for: {url}. Ensure all deals have clickable Markdown links."
+    asyncio.create_task(_scrape_listing_impl(url))
+
+    async def event_stream():
+        try:
+            async for ev in get_agent_executor().astream_events({"input": query}, version="v2"):
+                if ev["event"] == "on_chat_model_stream":
+                    delta = ev["data"]["chunk"].content
+                    if delta:
+                        yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+            yield b"data: [DONE]\n\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield b"data: " + orjson.dumps({"error": f"Internal Protocol Error: {str(e)}"}) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 @app.get("/health")
 def health(): return {"status": "Online"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop + httptools are uvicorn's C-accelerated loop and HTTP parser.
+    # Workers default to 1 because the TTL caches are in-process; raise
+    # WEB_CONCURRENCY only alongside a shared cache tier.
+    uvicorn.run(
+        "agent:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        proxy_headers=True,
+    )
\ No newline at end of file